@@ -6,11 +6,16 @@ A Flask-based API for collaborative markdown editing
 import os
 from flask import Flask
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 
 from config import Config
 from database import init_db
+from cache import init_cache
+from background import init_background_tasks
+from storage import init_storage
+from jwt_cache import CachedJWTManager
+from json_provider import ORJSONProvider
+from uploads import UploadRequest
 from routes import register_routes
 
 # Load environment variables
@@ -19,14 +24,19 @@ load_dotenv()
 def create_app():
     """Create and configure the Flask application"""
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config.from_object(Config)
+    app.json = ORJSONProvider(app)
     
     # Initialize extensions
     CORS(app, origins=["http://localhost:3000", "https://mowndark.vercel.app"], supports_credentials=True)
-    JWTManager(app)
+    CachedJWTManager(app)
     
     # Initialize database
     init_db(app)
+    init_storage(app)
+    init_cache(app)
+    init_background_tasks(app)
     
     # Register routes
     register_routes(app)
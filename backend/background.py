@@ -0,0 +1,43 @@
+"""
+Background worker that flushes Redis write buffers to MongoDB
+"""
+
+import threading
+import time
+
+from cache import get_buffer_redis
+
+flush_thread = None
+
+def init_background_tasks(app):
+    """Start the periodic flush thread when Redis buffering is enabled
+    
+    Each worker process runs its own thread; the flush functions claim their
+    buffers atomically, so several flushers can run side by side.
+    """
+    global flush_thread
+    
+    if get_buffer_redis() is None:
+        return None
+    
+    interval = app.config['BUFFER_FLUSH_INTERVAL']
+    
+    from models.note import Note
+    from models.user import User
+    
+    tasks = [Note.flush_view_counts, User.flush_history]
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                for task in tasks:
+                    try:
+                        task()
+                    except Exception as e:
+                        print(f"Error in background flush: {e}")
+    
+    flush_thread = threading.Thread(target=run, name='mowndark-flush', daemon=True)
+    flush_thread.start()
+    
+    return flush_thread
@@ -0,0 +1,43 @@
+"""
+Optional Redis connection used for caching and write coalescing
+"""
+
+redis_client = None
+
+# Whether view counts and history are buffered in Redis; only when a flusher
+# runs to write them to MongoDB
+buffer_writes = False
+
+def init_cache(app):
+    """Initialize the Redis client when REDIS_URL is configured
+    
+    Without REDIS_URL every cache lookup is a miss and callers fall back to
+    MongoDB directly.
+    """
+    global redis_client, buffer_writes
+    
+    redis_url = app.config.get('REDIS_URL')
+    if not redis_url:
+        return None
+    
+    import redis
+    
+    redis_client = redis.Redis.from_url(
+        redis_url,
+        socket_timeout=app.config.get('REDIS_SOCKET_TIMEOUT', 0.5)
+    )
+    
+    app.extensions['redis'] = redis_client
+    buffer_writes = bool(app.config.get('BUFFER_FLUSH_INTERVAL', 10))
+    
+    return redis_client
+
+def get_redis():
+    """Get the Redis client, or None if caching is disabled"""
+    global redis_client
+    return redis_client
+
+def get_buffer_redis():
+    """Get the Redis client for write buffers, or None if buffering is disabled"""
+    global redis_client
+    return redis_client if buffer_writes else None
@@ -5,6 +5,14 @@ Configuration settings for the Mowndark backend
 import os
 from datetime import timedelta
 
+def _read_key(name):
+    """Read a PEM key from the environment, directly or via a <name>_FILE path"""
+    path = os.environ.get(f'{name}_FILE')
+    if path:
+        with open(path) as f:
+            return f.read()
+    return os.environ.get(name)
+
 class Config:
     """Application configuration class"""
     
@@ -14,17 +22,58 @@ class Config:
     
     # JWT settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-me')
+    # With an Ed25519 key pair configured, tokens are signed with EdDSA
+    # instead of HS256 and can be verified with the public key alone
+    JWT_PRIVATE_KEY = _read_key('JWT_PRIVATE_KEY')
+    JWT_PUBLIC_KEY = _read_key('JWT_PUBLIC_KEY')
+    JWT_ALGORITHM = os.environ.get(
+        'JWT_ALGORITHM', 'EdDSA' if JWT_PRIVATE_KEY and JWT_PUBLIC_KEY else 'HS256'
+    )
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    JWT_CACHE_ENABLED = os.environ.get('JWT_CACHE_ENABLED', 'true').lower() == 'true'
+    
+    # Password hashing settings (argon2id, OWASP minimums by default)
+    ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+    ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+    ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
     
     # MongoDB settings
     MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/mowndark')
     MONGODB_DB_NAME = 'mowndark'
+    MONGO_MAX_POOL = int(os.environ.get('MONGO_MAX_POOL', 200))
+    MONGO_MIN_POOL = int(os.environ.get('MONGO_MIN_POOL', 10))
+    MONGO_MAX_IDLE_MS = int(os.environ.get('MONGO_MAX_IDLE_MS', 300000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+    MONGO_ZLIB_LEVEL = int(os.environ.get('MONGO_ZLIB_LEVEL', 3))
+    
+    # Redis cache (optional; leave REDIS_URL unset to disable caching)
+    REDIS_URL = os.environ.get('REDIS_URL')
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+    IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', 86400))
+    IMAGE_CACHE_MAX_SIZE = int(os.environ.get('IMAGE_CACHE_MAX_SIZE', 1024 * 1024))
+    NOTE_CACHE_TTL = int(os.environ.get('NOTE_CACHE_TTL', 300))
+    # Seconds between flushes of Redis-buffered view counts and history; 0 turns
+    # buffering off and writes them straight to MongoDB
+    BUFFER_FLUSH_INTERVAL = float(os.environ.get('BUFFER_FLUSH_INTERVAL', 10))
+    
+    # Object storage for images (S3-compatible: AWS, MinIO, R2).
+    # Leave S3_BUCKET unset to keep images in GridFS.
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ENDPOINT = os.environ.get('S3_ENDPOINT')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', 3600))
     
     # Application settings
     ALLOW_ANONYMOUS = True
     DEFAULT_PERMISSION = 'editable'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
+    UPLOAD_MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB max per uploaded file
+    UPLOAD_SPOOL_SIZE = 1024 * 1024  # uploads above 1MB spill to disk
+    UPLOAD_FORM_OVERHEAD = 64 * 1024  # multipart boundaries and form fields around the file
     
     # Permission types (similar to CodiMD)
     PERMISSION_TYPES = ['freely', 'editable', 'limited', 'locked', 'protected', 'private']
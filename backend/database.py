@@ -2,45 +2,91 @@
 Database connection and initialization for MongoDB
 """
 
+from bson import ObjectId
 from pymongo import MongoClient
+from gridfs import GridFSBucket
 from flask import g
 
 mongo_client = None
 db = None
+fs = None
 
 def init_db(app):
     """Initialize MongoDB connection"""
-    global mongo_client, db
+    global mongo_client, db, fs
     
-    mongo_client = MongoClient(app.config['MONGODB_URI'])
+    mongo_client = MongoClient(
+        app.config['MONGODB_URI'],
+        maxPoolSize=app.config.get('MONGO_MAX_POOL', 200),
+        minPoolSize=app.config.get('MONGO_MIN_POOL', 10),
+        maxIdleTimeMS=app.config.get('MONGO_MAX_IDLE_MS', 300000),
+        waitQueueTimeoutMS=app.config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000),
+        retryWrites=True,
+        compressors=app.config.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib'),
+        zlibCompressionLevel=app.config.get('MONGO_ZLIB_LEVEL', 3),
+        appname='mowndark',
+        # Connect on first use, after gunicorn has forked and patched the worker
+        connect=False
+    )
     db = mongo_client[app.config['MONGODB_DB_NAME']]
     
+    # GridFS bucket for image binaries (images.files / images.chunks)
+    fs = GridFSBucket(db, bucket_name='images')
+    
     # Store db in app context
     app.db = db
+    app.fs = fs
     
     # Create indexes
     _create_indexes()
     
     return db
 
+# (collection, keys, options) for every index the app relies on; keep in
+# sync with db/init-mongo.js, since an index with the same name but other
+# options is rejected by the server
+INDEXES = [
+    # User indexes
+    ('users', 'email', {'unique': True}),
+    # Users and notes store username / alias as null when unset, and a sparse
+    # index still indexes explicit nulls, so only index real strings
+    ('users', 'username', {'unique': True, 'partialFilterExpression': {'username': {'$type': 'string'}}}),
+    
+    # Note indexes
+    ('notes', 'shortid', {'unique': True, 'sparse': True}),
+    ('notes', 'alias', {'unique': True, 'partialFilterExpression': {'alias': {'$type': 'string'}}}),
+    ('notes', 'owner_id', {}),
+    ('notes', 'created_at', {}),
+    ('notes', 'updated_at', {}),
+    
+    # Compound indexes so filtered listings are served already sorted
+    ('notes', [('owner_id', 1), ('updated_at', -1)], {}),
+    ('notes', [('permission', 1), ('updated_at', -1)], {}),
+    ('notes', [('owner_id', 1), ('permission', 1), ('updated_at', -1)], {}),
+    
+    # Image (GridFS file metadata) indexes
+    ('images.files', [('metadata.note_id', 1), ('uploadDate', -1)], {}),
+    ('images.files', [('metadata.uploaded_by', 1), ('uploadDate', -1)], {}),
+    # Content hash lookup for de-duplicating re-uploads
+    ('images.files', [('metadata.sha256', 1), ('metadata.uploaded_by', 1), ('metadata.note_id', 1)], {'sparse': True}),
+]
+
 def _create_indexes():
-    """Create database indexes for better query performance"""
+    """Create database indexes for better query performance
+    
+    Each index is created on its own, so one that conflicts with an existing
+    definition is reported without skipping the rest.
+    """
     global db
     
-    if db is not None:
+    if db is None:
+        return
+    
+    for collection_name, keys, options in INDEXES:
         try:
-            # User indexes
-            db.users.create_index('email', unique=True, background=True)
-            db.users.create_index('username', unique=True, sparse=True, background=True)
-            
-            # Note indexes - use sparse=True to allow null values
-            db.notes.create_index('shortid', unique=True, sparse=True, background=True)
-            db.notes.create_index('alias', unique=True, sparse=True, background=True)
-            db.notes.create_index('owner_id', background=True)
-            db.notes.create_index('created_at', background=True)
-            db.notes.create_index('updated_at', background=True)
+            db[collection_name].create_index(keys, background=True, **options)
         except Exception as e:
-            print(f"Warning: Index creation issue (may already exist): {e}")
+            print(f"Warning: Index creation issue on {collection_name} {keys}: {e}")
 
 def get_db():
     """Get database instance"""
@@ -53,3 +99,17 @@ def get_collection(collection_name):
     if db is not None:
         return db[collection_name]
     return None
+
+def get_bucket():
+    """Get the GridFS bucket used for image storage"""
+    global fs
+    return fs
+
+def to_object_id(value):
+    """Return value as an ObjectId, parsing it only if it is not one already
+    
+    Raises bson.errors.InvalidId / TypeError for malformed ids.
+    """
+    if isinstance(value, ObjectId):
+        return value
+    return ObjectId(value)
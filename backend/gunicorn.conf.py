@@ -0,0 +1,22 @@
+"""
+Gunicorn settings - gevent workers for the I/O-bound API
+
+The gevent worker monkey-patches the standard library before the app is
+imported, so pymongo and redis sockets yield to other requests while they
+wait.
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+# Concurrent requests per worker. Defaults to the MongoDB pool size (see
+# Config.MONGO_MAX_POOL) so every greenlet can get a pooled connection
+# instead of waiting for one until waitQueueTimeoutMS fails the request
+worker_connections = int(os.environ.get(
+    'GUNICORN_WORKER_CONNECTIONS', os.environ.get('MONGO_MAX_POOL', 200)
+))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,34 @@
+"""
+orjson-backed JSON provider for Flask responses
+"""
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson
+    
+    datetimes are encoded natively (naive values are treated as UTC), dict
+    keys may be ints, UUIDs or datetimes as well as strings, and any other
+    unsupported value, such as ObjectId, falls back to str().
+    """
+    
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=self.option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Encode straight to bytes in one pass, skipping the str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.option | orjson.OPT_APPEND_NEWLINE
+        
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        
+        return self._app.response_class(
+            orjson.dumps(obj, default=str, option=option), mimetype=self.mimetype
+        )
@@ -0,0 +1,57 @@
+"""
+JWT manager with a short-lived cache of verified token claims
+"""
+
+import hashlib
+import threading
+import time
+
+from cachetools import TTLCache
+from flask_jwt_extended import JWTManager
+
+
+class CachedJWTManager(JWTManager):
+    """JWTManager that skips signature verification for recently seen tokens
+
+    Verified claims are cached for a few seconds keyed by a digest of the raw
+    token. Only successfully decoded tokens are stored, and the `exp` claim is
+    still checked on every hit.
+    """
+
+    def __init__(self, app=None, add_context_processor=False, maxsize=10000, ttl=30):
+        self._claims_cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._claims_lock = threading.RLock()
+        self._cache_enabled = True
+        super().__init__(app, add_context_processor=add_context_processor)
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor=add_context_processor)
+        self._cache_enabled = app.config.get('JWT_CACHE_ENABLED', True)
+
+    @staticmethod
+    def _cache_key(encoded_token):
+        return hashlib.sha256(encoded_token.encode('utf-8')).digest()[:16]
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # CSRF checks and expired-token decoding always take the full path
+        if not self._cache_enabled or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = self._cache_key(encoded_token)
+        with self._claims_lock:
+            claims = self._claims_cache.get(key)
+
+        if claims is not None:
+            exp = claims.get('exp')
+            if exp is None or exp > time.time():
+                return claims
+            # Expired: drop it and let the original decoder raise the proper error
+            with self._claims_lock:
+                self._claims_cache.pop(key, None)
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        with self._claims_lock:
+            self._claims_cache[key] = claims
+
+        return claims
@@ -1,109 +1,342 @@
 """
-Image model for MongoDB - stores images as binary data
+Image model for MongoDB - stores images in GridFS or an S3-compatible store
 """
 
+import uuid
 from datetime import datetime
-from bson import ObjectId, Binary
-from database import get_collection
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
+from pymongo import DeleteMany
+from redis import RedisError
+from database import get_collection, get_bucket, to_object_id
+from storage import get_s3, get_s3_bucket
+from cache import get_redis
 
 class Image:
-    """Image model class for storing images in MongoDB"""
+    """Image model class for storing images in MongoDB GridFS
     
-    collection_name = 'images'
+    When an object store is configured the bytes go to S3 instead, and only a
+    GridFS-shaped file document (with `metadata.s3_key`) is kept in Mongo so
+    listings and permission checks work the same for both backends.
+    """
+    
+    # GridFS keeps file metadata in <bucket>.files and the bytes in <bucket>.chunks
+    collection_name = 'images.files'
+    chunks_collection_name = 'images.chunks'
+    
+    # Fields needed by to_json for listings; skips checksums and storage details
+    LIST_PROJECTION = {
+        'filename': 1,
+        'length': 1,
+        'uploadDate': 1,
+        'metadata.content_type': 1,
+        'metadata.note_id': 1,
+        'metadata.uploaded_by': 1
+    }
     
     @staticmethod
     def get_collection():
         return get_collection(Image.collection_name)
     
     @staticmethod
-    def create(filename, content_type, data, size, note_id=None, uploaded_by=None):
-        """Create a new image record"""
-        collection = Image.get_collection()
+    def get_chunks_collection():
+        return get_collection(Image.chunks_collection_name)
+    
+    @staticmethod
+    def get_bucket():
+        return get_bucket()
+    
+    @staticmethod
+    def create(filename, content_type, data, size=None, note_id=None, uploaded_by=None, sha256=None):
+        """Create a new image record
         
-        image_data = {
-            'filename': filename,
+        `data` may be bytes or a readable file-like object; it is written to
+        GridFS in chunks, or uploaded to S3 when an object store is configured.
+        """
+        metadata = {
             'content_type': content_type,
-            'data': Binary(data),  # Store as binary
-            'size': size,
             'note_id': note_id,
-            'uploaded_by': uploaded_by,
-            'created_at': datetime.utcnow()
+            'uploaded_by': uploaded_by
         }
+        if sha256:
+            metadata['sha256'] = sha256
         
         try:
-            result = collection.insert_one(image_data)
-            image_data['_id'] = result.inserted_id
-            return image_data
+            if get_s3() is not None:
+                return Image._create_s3(filename, content_type, data, size, metadata)
+            
+            file_id = Image.get_bucket().upload_from_stream(filename, data, metadata=metadata)
+            return Image.find_file(file_id)
         except Exception as e:
             print(f"Error creating image: {e}")
             return None
     
     @staticmethod
-    def find_by_id(image_id):
-        """Find image by ID"""
+    def _create_s3(filename, content_type, data, size, metadata):
+        """Upload image bytes to S3 and record a metadata-only file document"""
+        key = f"{metadata['note_id'] or 'unattached'}/{uuid.uuid4().hex}"
+        get_s3().put_object(
+            Bucket=get_s3_bucket(),
+            Key=key,
+            Body=data,
+            ContentType=content_type
+        )
+        
+        file_doc = {
+            '_id': ObjectId(),
+            'filename': filename,
+            'length': size,
+            'chunkSize': 0,  # no GridFS chunks; the bytes live in S3
+            'uploadDate': datetime.utcnow(),
+            'metadata': {**metadata, 's3_key': key}
+        }
+        Image.get_collection().insert_one(file_doc)
+        return file_doc
+    
+    @staticmethod
+    def presigned_url(image):
+        """Return a time-limited S3 URL for an image kept in the object store"""
+        from flask import current_app
+        
+        return get_s3().generate_presigned_url(
+            'get_object',
+            Params={'Bucket': get_s3_bucket(), 'Key': image.metadata['s3_key']},
+            ExpiresIn=current_app.config.get('S3_PRESIGN_EXPIRES', 3600)
+        )
+    
+    @staticmethod
+    def find_file(image_id):
+        """Find the GridFS file document (metadata only) by ID"""
         collection = Image.get_collection()
         try:
-            return collection.find_one({'_id': ObjectId(image_id)})
-        except:
+            return collection.find_one({'_id': to_object_id(image_id)})
+        except (InvalidId, TypeError):
             return None
     
+    @staticmethod
+    def find_duplicate(sha256, note_id=None, uploaded_by=None):
+        """Find an identical image already uploaded by the same user to the same note
+        
+        Duplicates are only matched within one uploader and note, so deleting
+        an image never removes a copy someone else still references.
+        """
+        collection = Image.get_collection()
+        return collection.find_one(
+            {
+                'metadata.sha256': sha256,
+                'metadata.uploaded_by': uploaded_by,
+                'metadata.note_id': note_id
+            },
+            Image.LIST_PROJECTION
+        )
+    
+    @staticmethod
+    def find_by_id(image_id):
+        """Open a GridOut stream for an image, or None if it does not exist"""
+        bucket = Image.get_bucket()
+        try:
+            return bucket.open_download_stream(to_object_id(image_id))
+        except (InvalidId, TypeError, NoFile):
+            return None
+    
+    @staticmethod
+    def cache_key(image_id):
+        return f"v1:img:{image_id}"
+    
+    @staticmethod
+    def get_cached(image_id):
+        """Return (content_type, filename, data) from Redis, or None on a miss"""
+        r = get_redis()
+        if r is None:
+            return None
+        
+        try:
+            content_type, filename, data = r.hmget(Image.cache_key(image_id), 'ct', 'fn', 'data')
+        except RedisError:
+            return None
+        
+        if data is None:
+            return None
+        return content_type.decode('utf-8'), filename.decode('utf-8'), data
+    
+    @staticmethod
+    def set_cached(image_id, content_type, filename, data):
+        """Store image bytes in Redis (images are immutable, so a long TTL is safe)"""
+        r = get_redis()
+        if r is None:
+            return
+        
+        from flask import current_app
+        
+        key = Image.cache_key(image_id)
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.hset(key, mapping={'ct': content_type, 'fn': filename, 'data': data})
+            pipe.expire(key, current_app.config.get('IMAGE_CACHE_TTL', 86400))
+            pipe.execute()
+        except RedisError:
+            pass
+    
+    @staticmethod
+    def invalidate_cache(image_ids):
+        """Drop cached bytes for the given image IDs"""
+        r = get_redis()
+        if r is None or not image_ids:
+            return
+        
+        try:
+            r.delete(*[Image.cache_key(image_id) for image_id in image_ids])
+        except RedisError:
+            pass
+    
     @staticmethod
     def find_by_note(note_id):
         """Find all images for a note"""
         collection = Image.get_collection()
         return list(collection.find(
-            {'note_id': note_id},
-            {'data': 0}  # Exclude binary data for listing
-        ).sort('created_at', -1))
+            {'metadata.note_id': note_id}, Image.LIST_PROJECTION
+        ).sort('uploadDate', -1))
     
     @staticmethod
     def find_by_user(user_id):
         """Find all images uploaded by a user"""
         collection = Image.get_collection()
         return list(collection.find(
-            {'uploaded_by': user_id},
-            {'data': 0}
-        ).sort('created_at', -1))
+            {'metadata.uploaded_by': user_id}, Image.LIST_PROJECTION
+        ).sort('uploadDate', -1))
     
     @staticmethod
     def delete(image_id):
         """Delete an image"""
-        collection = Image.get_collection()
         try:
-            result = collection.delete_one({'_id': ObjectId(image_id)})
-            return result.deleted_count > 0
-        except:
+            return Image.delete_files([to_object_id(image_id)])
+        except (InvalidId, TypeError):
             return False
     
     @staticmethod
-    def delete_by_note(note_id):
-        """Delete all images for a note"""
-        collection = Image.get_collection()
+    def delete_if_owner(image_id, user_id):
+        """Atomically delete an image uploaded by `user_id`
+        
+        Returns the deleted file document, or None if no such image is owned
+        by the user (see `exists` to tell the two cases apart).
+        """
+        try:
+            image = Image.get_collection().find_one_and_delete(
+                {'_id': to_object_id(image_id), 'metadata.uploaded_by': user_id}
+            )
+        except (InvalidId, TypeError):
+            return None
+        
+        if image is not None:
+            try:
+                Image._delete_data([image])
+            except Exception as e:
+                print(f"Error deleting image data: {e}")
+        return image
+    
+    @staticmethod
+    def exists(image_id):
+        """Check whether an image file document exists"""
         try:
-            collection.delete_many({'note_id': note_id})
+            oid = to_object_id(image_id)
+        except (InvalidId, TypeError):
+            return False
+        return Image.get_collection().count_documents({'_id': oid}, limit=1) > 0
+    
+    @staticmethod
+    def _delete_data(images):
+        """Remove the bytes behind already-fetched file documents
+        
+        Deletes any S3 objects and GridFS chunks and drops the Redis copies.
+        """
+        file_ids = [image['_id'] for image in images]
+        keys = [
+            image['metadata']['s3_key'] for image in images
+            if (image.get('metadata') or {}).get('s3_key')
+        ]
+        
+        s3 = get_s3()
+        if s3 is not None:
+            # delete_objects accepts at most 1000 keys per call
+            for i in range(0, len(keys), 1000):
+                s3.delete_objects(
+                    Bucket=get_s3_bucket(),
+                    Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+                )
+        
+        Image.get_chunks_collection().bulk_write(
+            [DeleteMany({'files_id': {'$in': file_ids}})], ordered=False
+        )
+        Image.invalidate_cache(file_ids)
+    
+    @staticmethod
+    def delete_files(file_ids):
+        """Delete image files with one bulk op per collection
+        
+        Removes any S3 objects, the GridFS chunks and the file documents.
+        """
+        if not file_ids:
             return True
-        except:
+        try:
+            if get_s3() is not None:
+                images = list(Image.get_collection().find(
+                    {'_id': {'$in': file_ids}}, {'metadata.s3_key': 1}
+                ))
+            else:
+                images = [{'_id': file_id} for file_id in file_ids]
+            
+            Image._delete_data(images)
+            result = Image.get_collection().bulk_write(
+                [DeleteMany({'_id': {'$in': file_ids}})], ordered=False
+            )
+            return result.deleted_count > 0
+        except Exception as e:
+            print(f"Error deleting images: {e}")
             return False
     
     @staticmethod
-    def to_json(image, include_data=False):
-        """Convert image document to JSON-serializable dict"""
+    def delete_by_note(note_id):
+        """Delete all images for a note
+        
+        `note_id` may be a single reference or a list, since uploads record the
+        note by shortid.
+        """
+        collection = Image.get_collection()
+        note_ids = list(note_id) if isinstance(note_id, (list, tuple)) else [note_id]
+        file_ids = [
+            image['_id'] for image in collection.find(
+                {'metadata.note_id': {'$in': note_ids}}, {'_id': 1}
+            )
+        ]
+        return Image.delete_files(file_ids)
+    
+    @staticmethod
+    def delete_by_user(user_id):
+        """Delete all images uploaded by a user"""
+        collection = Image.get_collection()
+        file_ids = [
+            image['_id'] for image in collection.find(
+                {'metadata.uploaded_by': user_id}, {'_id': 1}
+            )
+        ]
+        return Image.delete_files(file_ids)
+    
+    @staticmethod
+    def to_json(image):
+        """Convert a GridFS file document to JSON-serializable dict"""
         if not image:
             return None
         
-        result = {
+        metadata = image.get('metadata') or {}
+        
+        return {
             'id': str(image['_id']),
             'filename': image.get('filename'),
-            'content_type': image.get('content_type'),
-            'size': image.get('size'),
-            'note_id': image.get('note_id'),
-            'uploaded_by': image.get('uploaded_by'),
+            'content_type': metadata.get('content_type'),
+            'size': image.get('length'),
+            'note_id': metadata.get('note_id'),
+            'uploaded_by': metadata.get('uploaded_by'),
             'url': f"/api/images/{image['_id']}",
-            'created_at': image.get('created_at').isoformat() if image.get('created_at') else None
+            'created_at': image.get('uploadDate')
         }
-        
-        if include_data and 'data' in image:
-            import base64
-            result['data'] = base64.b64encode(image['data']).decode('utf-8')
-        
-        return result
@@ -2,18 +2,100 @@
 Note model for MongoDB
 """
 
+import hashlib
+import math
+import random
+import re
+import secrets
+import time
 from datetime import datetime
+from functools import lru_cache
+import orjson
 from bson import ObjectId
-import shortuuid
-import markdown
-import bleach
-from database import get_collection
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from redis import RedisError
+from database import get_collection, to_object_id
+from cache import get_buffer_redis, get_redis
+from models.image import Image
+
+# Sanitizer whitelist for rendered markdown
+ALLOWED_TAGS = frozenset({
+    'a', 'abbr', 'acronym', 'b', 'em', 'i', 'strong', 's',
+    'p', 'pre', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+    'ul', 'ol', 'li', 'blockquote', 'hr', 'br',
+    'img', 'div', 'span'
+})
+ALLOWED_ATTRS = {
+    'abbr': {'title'},
+    'acronym': {'title'},
+    'img': {'src', 'alt', 'title'},
+    'a': {'href', 'title', 'target'},
+    'code': {'class'},
+    'pre': {'class'},
+    'div': {'class'},
+    'span': {'class'}
+}
+
+# Patterns used to strip markdown formatting when generating descriptions
+_HEADING_RE = re.compile(r'^#+\s+', re.MULTILINE)
+_LINK_RE = re.compile(r'\[([^\]]+)\]\([^\)]+\)')
+_IMG_RE = re.compile(r'!\[([^\]]*)\]\([^\)]+\)')
+_BOLD_RE = re.compile(r'\*+([^\*]+)\*+')
+_ITALIC_RE = re.compile(r'_+([^_]+)_+')
+_FENCED_RE = re.compile(r'```[^`]*```', re.DOTALL)
+_INLINE_CODE_RE = re.compile(r'`[^`]+`')
+
+# First level-1 heading, used as the note title; only the head of the content is searched
+_TITLE_RE = re.compile(r'^# (.+)$', re.MULTILINE)
+TITLE_SEARCH_WINDOW = 4096
+
+@lru_cache(maxsize=None)
+def _markdown_parser():
+    """Build the shared markdown-it parser on first use (render is thread-safe)"""
+    from markdown_it import MarkdownIt
+    
+    return MarkdownIt('commonmark', {'html': True}).enable(['table', 'strikethrough'])
+
+@lru_cache(maxsize=2048)
+def _render_html_cached(content_hash, content):
+    """Render and sanitize markdown, memoized by content hash"""
+    import nh3
+    
+    # Convert markdown to HTML
+    html = _markdown_parser().render(content)
+    
+    # Sanitize HTML
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS)
+
+# Subtract flushed counts from the view buffer, dropping fields that reach zero
+_DRAIN_VIEW_COUNTS_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    if redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1])) <= 0 then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return #ARGV / 2
+"""
 
 class Note:
     """Note model class with static methods for database operations"""
     
     collection_name = 'notes'
     
+    # Attempts at drawing a fresh shortid when an insert collides
+    SHORTID_RETRIES = 3
+    
+    # Redis hash of note ID -> views not yet written to MongoDB
+    VIEW_COUNTS_KEY = 'v1:note:views'
+    # Seconds a view-count flush may hold its lock before another worker takes over
+    VIEW_FLUSH_LOCK_TTL = 60
+    
+    # Redis key segment for each cached lookup field
+    LOOKUP_CACHE_PREFIXES = {'shortid': 'short', 'alias': 'alias'}
+    
     # Permission types (similar to CodiMD)
     PERMISSION_FREELY = 'freely'      # Anyone can edit
     PERMISSION_EDITABLE = 'editable'  # Signed-in users can edit
@@ -22,14 +104,31 @@ class Note:
     PERMISSION_PROTECTED = 'protected' # Only owner can edit, anyone can view
     PERMISSION_PRIVATE = 'private'    # Only owner can view and edit
     
+    # Permissions whose notes are readable by anyone
+    PUBLIC_PERMISSIONS = [PERMISSION_FREELY, PERMISSION_EDITABLE, PERMISSION_PROTECTED]
+    
+    # Listings use the stored description and never fetch the markdown body
+    LIST_PROJECTION = {
+        'description': 1,
+        'shortid': 1,
+        'alias': 1,
+        'title': 1,
+        'permission': 1,
+        'view_count': 1,
+        'owner_id': 1,
+        'last_change_user_id': 1,
+        'created_at': 1,
+        'updated_at': 1
+    }
+    
     @staticmethod
     def get_collection():
         return get_collection(Note.collection_name)
     
     @staticmethod
     def generate_shortid():
-        """Generate a unique short ID"""
-        return shortuuid.uuid()[:10]
+        """Generate a random 10-character URL-safe short ID"""
+        return secrets.token_urlsafe(7)
     
     @staticmethod
     def create(owner_id=None, title='Untitled', content='', permission='private', alias=None):
@@ -45,6 +144,7 @@ class Note:
             'alias': alias,
             'title': title,
             'content': content,
+            'description': Note.generate_description(content),
             'owner_id': owner_id,
             'permission': permission if owner_id else 'freely',
             'view_count': 0,
@@ -53,64 +153,173 @@ class Note:
             'updated_at': datetime.utcnow()
         }
         
-        try:
-            result = collection.insert_one(note_data)
-            note_data['_id'] = result.inserted_id
-            return note_data
-        except Exception as e:
-            print(f"Error creating note: {e}")
-            return None
+        for _ in range(Note.SHORTID_RETRIES):
+            try:
+                result = collection.insert_one(note_data)
+                note_data['_id'] = result.inserted_id
+                return note_data
+            except DuplicateKeyError as e:
+                # Only a shortid collision is worth retrying
+                if 'shortid' not in (e.details or {}).get('keyPattern', {}):
+                    print(f"Error creating note: {e}")
+                    return None
+                note_data.pop('_id', None)
+                note_data['shortid'] = Note.generate_shortid()
+            except Exception as e:
+                print(f"Error creating note: {e}")
+                return None
+        
+        print("Error creating note: could not generate a unique shortid")
+        return None
     
     @staticmethod
     def find_by_id(note_id):
         """Find note by MongoDB ID"""
         collection = Note.get_collection()
         try:
-            return collection.find_one({'_id': ObjectId(note_id)})
-        except:
+            return collection.find_one({'_id': to_object_id(note_id)})
+        except (InvalidId, TypeError):
             return None
     
     @staticmethod
     def find_by_shortid(shortid):
         """Find note by short ID"""
-        collection = Note.get_collection()
-        return collection.find_one({'shortid': shortid})
+        return Note._cached_find_one(('shortid',), shortid)
     
     @staticmethod
     def find_by_alias(alias):
         """Find note by alias"""
-        collection = Note.get_collection()
-        return collection.find_one({'alias': alias})
+        return Note._cached_find_one(('alias',), alias)
     
     @staticmethod
-    def find_by_id_or_shortid(note_id):
-        """Find note by either MongoDB ID or short ID"""
-        # Try shortid first
-        note = Note.find_by_shortid(note_id)
-        if note:
-            return note
+    def find_by_shortid_or_alias(value):
+        """Find note by short ID or alias in one query"""
+        return Note._cached_find_one(('shortid', 'alias'), value)
+    
+    @staticmethod
+    def lookup_cache_key(field, value):
+        return f"v1:note:{Note.LOOKUP_CACHE_PREFIXES[field]}:{value}"
+    
+    @staticmethod
+    def _cached_find_one(fields, value):
+        """Cache-aside lookup of a note whose shortid or alias equals `value`
+        
+        Entries record when they were cached and how long the Mongo read
+        took, and are refreshed early with a probability that grows as the
+        TTL runs out, so a popular note is not reloaded by every worker at
+        the moment it expires.
+        """
+        collection = Note.get_collection()
+        query = {'$or': [{field: value} for field in fields]} if len(fields) > 1 else {fields[0]: value}
+        r = get_redis()
+        if r is None:
+            return collection.find_one(query)
         
-        # Try alias
-        note = Note.find_by_alias(note_id)
-        if note:
-            return note
+        from flask import current_app
         
-        # Try MongoDB ID
-        return Note.find_by_id(note_id)
+        keys = [Note.lookup_cache_key(field, value) for field in fields]
+        ttl = current_app.config.get('NOTE_CACHE_TTL', 300)
+        
+        try:
+            cached = next((entry for entry in r.mget(keys) if entry is not None), None)
+        except RedisError:
+            cached = None
+        
+        if cached is not None:
+            entry = orjson.loads(cached)
+            expires_at = entry['cached_at'] + ttl
+            if time.time() - entry['delta'] * math.log(1.0 - random.random()) < expires_at:
+                return Note._from_cache(entry['note'])
+        
+        started = time.time()
+        note = collection.find_one(query)
+        if note is None:
+            return None
+        
+        # Cache under the field that actually matched
+        key = next(k for field, k in zip(fields, keys) if note.get(field) == value)
+        entry = {'cached_at': time.time(), 'delta': time.time() - started, 'note': note}
+        try:
+            r.setex(key, ttl, orjson.dumps(entry, default=str, option=orjson.OPT_NAIVE_UTC))
+        except RedisError:
+            pass
+        return note
+    
+    @staticmethod
+    def _from_cache(note):
+        """Restore the BSON types lost when a note was cached as JSON"""
+        note['_id'] = ObjectId(note['_id'])
+        for field in ('created_at', 'updated_at'):
+            if note.get(field):
+                note[field] = datetime.fromisoformat(note[field]).replace(tzinfo=None)
+        return note
+    
+    @staticmethod
+    def invalidate_cache(*notes):
+        """Drop cached shortid / alias lookups for the given note documents"""
+        r = get_redis()
+        if r is None:
+            return
+        
+        keys = [
+            Note.lookup_cache_key(field, note[field])
+            for note in notes if note
+            for field in Note.LOOKUP_CACHE_PREFIXES if note.get(field)
+        ]
+        if not keys:
+            return
+        try:
+            r.delete(*keys)
+        except RedisError:
+            pass
+    
+    @staticmethod
+    def _identifier_query(note_id):
+        """Match a note by MongoDB ID, short ID or alias"""
+        or_clauses = [{'shortid': note_id}, {'alias': note_id}]
+        # Only 24-char hex strings can be an _id; skip the clause otherwise
+        if ObjectId.is_valid(note_id):
+            or_clauses.append({'_id': ObjectId(note_id)})
+        return {'$or': or_clauses}
+    
+    @staticmethod
+    def find_by_id_or_shortid(note_id):
+        """Find note by either MongoDB ID, short ID or alias in one query"""
+        collection = Note.get_collection()
+        return collection.find_one(Note._identifier_query(note_id))
+    
+    @staticmethod
+    def exists(note_id):
+        """Check whether a note with this ID, short ID or alias exists"""
+        collection = Note.get_collection()
+        return collection.count_documents(Note._identifier_query(note_id), limit=1) > 0
     
     @staticmethod
     def find_by_owner(owner_id):
         """Find all notes by owner"""
         collection = Note.get_collection()
-        return list(collection.find({'owner_id': owner_id}).sort('updated_at', -1))
+        return list(collection.find(
+            {'owner_id': owner_id},
+            Note.LIST_PROJECTION
+        ).sort('updated_at', -1))
     
     @staticmethod
     def find_public_notes(limit=20):
         """Find publicly viewable notes"""
         collection = Note.get_collection()
-        return list(collection.find({
-            'permission': {'$in': ['freely', 'editable', 'protected']}
-        }).sort('updated_at', -1).limit(limit))
+        return list(collection.find(
+            {'permission': {'$in': Note.PUBLIC_PERMISSIONS}},
+            Note.LIST_PROJECTION
+        ).sort('updated_at', -1).limit(limit))
+    
+    @staticmethod
+    def find_public_by_owner(owner_id, limit=50):
+        """Find an owner's publicly viewable notes (summary fields only)"""
+        collection = Note.get_collection()
+        return list(collection.find(
+            {'owner_id': owner_id, 'permission': {'$in': Note.PUBLIC_PERMISSIONS}},
+            Note.LIST_PROJECTION
+        ).sort('updated_at', -1).limit(limit))
     
     @staticmethod
     def update(note_id, update_data, user_id=None):
@@ -121,58 +330,197 @@ class Note:
         if user_id:
             update_data['last_change_user_id'] = user_id
         
+        # Keep the stored description in sync with the content
+        if 'content' in update_data:
+            update_data['description'] = Note.generate_description(update_data['content'])
+        
         # Extract title from content if not provided
         if 'content' in update_data and 'title' not in update_data:
             content = update_data['content']
             # Try to extract title from first heading
-            lines = content.split('\n')
-            for line in lines:
-                if line.startswith('# '):
-                    update_data['title'] = line[2:].strip()
-                    break
+            match = _TITLE_RE.search(content, 0, min(len(content), TITLE_SEARCH_WINDOW))
+            if match:
+                update_data['title'] = match.group(1).strip()
         
         try:
-            result = collection.find_one_and_update(
-                {'_id': ObjectId(note_id)},
-                {'$set': update_data},
-                return_document=True
+            # Fetch the old version so a changed alias is invalidated as well;
+            # with a plain $set the new version is the old one plus the update
+            previous = collection.find_one_and_update(
+                {'_id': to_object_id(note_id)},
+                {'$set': update_data}
             )
-            return result
         except Exception as e:
             print(f"Error updating note: {e}")
             return None
+        
+        if previous is None:
+            return None
+        result = {**previous, **update_data}
+        Note.invalidate_cache(previous, result)
+        return result
     
     @staticmethod
     def delete(note_id):
         """Delete note"""
         collection = Note.get_collection()
         try:
-            result = collection.delete_one({'_id': ObjectId(note_id)})
-            return result.deleted_count > 0
-        except:
+            note = collection.find_one_and_delete(
+                {'_id': to_object_id(note_id)},
+                projection={'shortid': 1, 'alias': 1}
+            )
+        except (InvalidId, TypeError):
             return False
+        Note.invalidate_cache(note)
+        return note is not None
+    
+    @staticmethod
+    def delete_if_owner(note_id, owner_id):
+        """Atomically delete a note owned by `owner_id`, cascading to its images
+        
+        Returns the deleted note, or None if no such note is owned by the user
+        (see `exists` to tell the two cases apart).
+        """
+        collection = Note.get_collection()
+        query = Note._identifier_query(note_id)
+        query['owner_id'] = owner_id
+        note = collection.find_one_and_delete(query, projection={'_id': 1, 'shortid': 1, 'alias': 1})
+        
+        if note is not None:
+            Note.invalidate_cache(note)
+            # The note is already gone, so a failed cascade only leaves
+            # orphaned images behind and must not fail the delete
+            try:
+                Note._delete_images(note)
+            except PyMongoError as e:
+                print(f"Error deleting images of note {note['_id']}: {e}")
+        return note
+    
+    @staticmethod
+    def _delete_images(note):
+        """Delete the images attached to a deleted note"""
+        # Uploads reference the note by shortid; accept the ObjectId form too
+        note_refs = [str(note['_id'])]
+        if note.get('shortid'):
+            note_refs.append(note['shortid'])
+        Image.delete_by_note(note_refs)
     
     @staticmethod
     def delete_by_owner(owner_id):
         """Delete all notes by owner"""
         collection = Note.get_collection()
         try:
+            notes = list(collection.find(
+                {'owner_id': owner_id}, {'shortid': 1, 'alias': 1}
+            )) if get_redis() is not None else []
             collection.delete_many({'owner_id': owner_id})
-            return True
-        except:
+        except PyMongoError:
             return False
+        Note.invalidate_cache(*notes)
+        return True
     
     @staticmethod
     def increment_view_count(note_id):
-        """Increment the view count of a note"""
+        """Increment the view count of a note
+        
+        With Redis buffering enabled the view is buffered in a hash and
+        written to MongoDB later by `flush_view_counts`. Returns the number of
+        earlier views still waiting in the buffer, so callers can show an up
+        to date count.
+        """
+        r = get_buffer_redis()
+        if r is not None:
+            try:
+                return r.hincrby(Note.VIEW_COUNTS_KEY, str(note_id), 1) - 1
+            except RedisError:
+                pass
+        
         collection = Note.get_collection()
         try:
             collection.update_one(
-                {'_id': ObjectId(note_id)},
+                {'_id': to_object_id(note_id)},
                 {'$inc': {'view_count': 1}}
             )
-        except:
+        except (InvalidId, TypeError):
             pass
+        return 0
+    
+    @staticmethod
+    def flush_view_counts():
+        """Write buffered view counts to MongoDB with one unordered bulk $inc
+        
+        One worker flushes at a time (guarded by a short Redis lock). Counts
+        are only subtracted from the buffer once MongoDB has applied them, so
+        views that fail to reach MongoDB stay buffered for the next flush.
+        """
+        r = get_redis()
+        if r is None:
+            return 0
+        
+        lock_key = f"{Note.VIEW_COUNTS_KEY}:lock"
+        try:
+            if not r.set(lock_key, 1, nx=True, ex=Note.VIEW_FLUSH_LOCK_TTL):
+                # Another worker is flushing
+                return 0
+        except RedisError as e:
+            print(f"Error flushing view counts: {e}")
+            return 0
+        
+        try:
+            buffered = r.hgetall(Note.VIEW_COUNTS_KEY)
+            counts = {note_id.decode('utf-8'): int(count) for note_id, count in buffered.items()}
+            applied = Note._apply_view_counts(counts)
+            
+            # Cached lookups hold the old stored count, which would go backwards
+            # once the buffer is drained; drop them so they reload the new one
+            if applied:
+                try:
+                    Note.invalidate_cache(*Note.get_collection().find(
+                        {'_id': {'$in': [ObjectId(note_id) for note_id in applied]}},
+                        {'shortid': 1, 'alias': 1}
+                    ))
+                except PyMongoError as e:
+                    print(f"Error invalidating flushed notes: {e}")
+            
+            # Entries that are not note IDs can never be applied; drop them too
+            drained = {
+                note_id: count for note_id, count in counts.items()
+                if note_id in applied or not ObjectId.is_valid(note_id)
+            }
+            if drained:
+                args = [value for item in drained.items() for value in item]
+                r.register_script(_DRAIN_VIEW_COUNTS_SCRIPT)(keys=[Note.VIEW_COUNTS_KEY], args=args)
+            return len(applied)
+        except RedisError as e:
+            print(f"Error flushing view counts: {e}")
+            return 0
+        finally:
+            try:
+                r.delete(lock_key)
+            except RedisError:
+                pass
+    
+    @staticmethod
+    def _apply_view_counts(counts):
+        """$inc view counts in MongoDB; return the note IDs that were updated"""
+        note_ids = [note_id for note_id in counts if ObjectId.is_valid(note_id)]
+        if not note_ids:
+            return set()
+        
+        ops = [
+            UpdateOne({'_id': ObjectId(note_id)}, {'$inc': {'view_count': counts[note_id]}})
+            for note_id in note_ids
+        ]
+        try:
+            Note.get_collection().bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            print(f"Error flushing view counts: {e}")
+            # Unordered: everything except the reported ops was applied
+            failed = {note_ids[error['index']] for error in e.details.get('writeErrors', [])}
+            return set(note_ids) - failed
+        except PyMongoError as e:
+            print(f"Error flushing view counts: {e}")
+            return set()
+        return set(note_ids)
     
     @staticmethod
     def is_owner(note, user_id):
@@ -229,33 +577,8 @@ class Note:
     @staticmethod
     def render_html(content):
         """Render markdown content to HTML"""
-        # Convert markdown to HTML
-        html = markdown.markdown(content, extensions=[
-            'extra',
-            'codehilite',
-            'toc',
-            'tables',
-            'fenced_code'
-        ])
-        
-        # Sanitize HTML
-        allowed_tags = bleach.ALLOWED_TAGS | {
-            'p', 'pre', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-            'table', 'thead', 'tbody', 'tr', 'th', 'td',
-            'ul', 'ol', 'li', 'blockquote', 'hr', 'br',
-            'img', 'div', 'span'
-        }
-        allowed_attrs = {
-            **bleach.ALLOWED_ATTRIBUTES,
-            'img': ['src', 'alt', 'title'],
-            'a': ['href', 'title', 'target'],
-            'code': ['class'],
-            'pre': ['class'],
-            'div': ['class'],
-            'span': ['class']
-        }
-        
-        return bleach.clean(html, tags=allowed_tags, attributes=allowed_attrs)
+        content_hash = hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+        return _render_html_cached(content_hash, content)
     
     @staticmethod
     def generate_description(content, max_length=200):
@@ -263,18 +586,17 @@ class Note:
         # Remove markdown formatting
         text = content
         # Remove headings
-        import re
-        text = re.sub(r'^#+\s+', '', text, flags=re.MULTILINE)
+        text = _HEADING_RE.sub('', text)
         # Remove links
-        text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+        text = _LINK_RE.sub(r'\1', text)
         # Remove images
-        text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', '', text)
+        text = _IMG_RE.sub('', text)
         # Remove bold/italic
-        text = re.sub(r'\*+([^\*]+)\*+', r'\1', text)
-        text = re.sub(r'_+([^_]+)_+', r'\1', text)
+        text = _BOLD_RE.sub(r'\1', text)
+        text = _ITALIC_RE.sub(r'\1', text)
         # Remove code blocks
-        text = re.sub(r'```[^`]*```', '', text, flags=re.DOTALL)
-        text = re.sub(r'`[^`]+`', '', text)
+        text = _FENCED_RE.sub('', text)
+        text = _INLINE_CODE_RE.sub('', text)
         
         # Clean up whitespace
         text = ' '.join(text.split())
@@ -299,12 +621,17 @@ class Note:
             'view_count': note.get('view_count', 0),
             'owner_id': note.get('owner_id'),
             'last_change_user_id': note.get('last_change_user_id'),
-            'created_at': note.get('created_at').isoformat() if note.get('created_at') else None,
-            'updated_at': note.get('updated_at').isoformat() if note.get('updated_at') else None
+            'created_at': note.get('created_at'),
+            'updated_at': note.get('updated_at')
         }
         
         if include_content:
             result['content'] = note.get('content', '')
-            result['description'] = Note.generate_description(note.get('content', ''))
+        
+        # Descriptions are computed on write; fall back for notes saved before that
+        if 'description' in note:
+            result['description'] = note['description']
+        elif 'content' in note:
+            result['description'] = Note.generate_description(note['content'])
         
         return result
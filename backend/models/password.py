@@ -0,0 +1,86 @@
+"""
+Password hashing for user accounts - argon2id with legacy bcrypt support
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+# Hashing is CPU-bound; run it off the request worker so other requests keep going
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='password-hash')
+
+def _run_hash(func, *args):
+    """Run a hashing call on an OS thread and wait for the result
+    
+    Under gevent the patched ThreadPoolExecutor would only hand the work to
+    another greenlet, so use the hub's native threadpool instead.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    
+    if monkey is not None and monkey.is_module_patched('threading'):
+        import gevent
+        
+        return gevent.get_hub().threadpool.apply(func, args)
+    return _HASH_POOL.submit(func, *args).result()
+
+# Hashes created before the switch to argon2id
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+class PasswordHasher:
+    """Password hasher with static methods, configured from the app config"""
+    
+    @staticmethod
+    def _argon2():
+        """Return the app's argon2 hasher, building it on first use"""
+        hasher = current_app.extensions.get('argon2_hasher')
+        if hasher is None:
+            import argon2
+            
+            hasher = argon2.PasswordHasher(
+                time_cost=current_app.config.get('ARGON2_TIME_COST', 2),
+                memory_cost=current_app.config.get('ARGON2_MEMORY_COST', 19456),
+                parallelism=current_app.config.get('ARGON2_PARALLELISM', 1)
+            )
+            current_app.extensions['argon2_hasher'] = hasher
+        return hasher
+    
+    @staticmethod
+    def is_legacy(hashed_password):
+        """Check if a stored hash is a legacy bcrypt hash"""
+        return hashed_password.startswith(BCRYPT_PREFIXES)
+    
+    @staticmethod
+    def hash(password):
+        """Hash a password with argon2id"""
+        hasher = PasswordHasher._argon2()
+        return _run_hash(hasher.hash, password)
+    
+    @staticmethod
+    def verify(hashed_password, password):
+        """Verify a password against an argon2id or legacy bcrypt hash"""
+        if PasswordHasher.is_legacy(hashed_password):
+            import bcrypt
+            
+            return _run_hash(
+                bcrypt.checkpw,
+                password.encode('utf-8'),
+                hashed_password.encode('utf-8')
+            )
+        
+        from argon2.exceptions import VerificationError, InvalidHashError
+        
+        hasher = PasswordHasher._argon2()
+        try:
+            return _run_hash(hasher.verify, hashed_password, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    @staticmethod
+    def needs_rehash(hashed_password):
+        """Check if a hash should be upgraded to the current argon2id parameters"""
+        if PasswordHasher.is_legacy(hashed_password):
+            return True
+        return PasswordHasher._argon2().check_needs_rehash(hashed_password)
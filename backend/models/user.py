@@ -2,16 +2,30 @@
 User model for MongoDB
 """
 
+import time
+import uuid
 from datetime import datetime
 from bson import ObjectId
-import bcrypt
-from database import get_collection
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from redis import RedisError, ResponseError
+from database import get_collection, to_object_id
+from cache import get_buffer_redis, get_redis
+from models.password import PasswordHasher
 
 class User:
     """User model class with static methods for database operations"""
     
     collection_name = 'users'
     
+    # Most recent history entries kept per user
+    HISTORY_LIMIT = 100
+    
+    # Redis set of users whose buffered history is not yet in MongoDB; the
+    # entries themselves are kept in a sorted set per user (see history_key)
+    HISTORY_DIRTY_KEY = 'v1:user:history:dirty'
+    
     @staticmethod
     def get_collection():
         return get_collection(User.collection_name)
@@ -22,10 +36,7 @@ class User:
         collection = User.get_collection()
         
         # Hash password
-        hashed_password = bcrypt.hashpw(
-            password.encode('utf-8'), 
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        hashed_password = PasswordHasher.hash(password)
         
         user_data = {
             'email': email.lower(),
@@ -51,8 +62,8 @@ class User:
         """Find user by ID"""
         collection = User.get_collection()
         try:
-            return collection.find_one({'_id': ObjectId(user_id)})
-        except:
+            return collection.find_one({'_id': to_object_id(user_id)})
+        except (InvalidId, TypeError):
             return None
     
     @staticmethod
@@ -69,27 +80,38 @@ class User:
     
     @staticmethod
     def verify_password(user, password):
-        """Verify user password"""
+        """Verify user password, upgrading outdated hashes on success"""
         if not user or not user.get('password'):
             return False
-        return bcrypt.checkpw(
-            password.encode('utf-8'),
-            user['password'].encode('utf-8')
-        )
+        
+        if not PasswordHasher.verify(user['password'], password):
+            return False
+        
+        # Transparently migrate legacy bcrypt hashes to argon2id
+        if PasswordHasher.needs_rehash(user['password']):
+            User.update_password(user['_id'], password)
+        
+        return True
     
     @staticmethod
     def update(user_id, update_data):
-        """Update user data"""
+        """Update user data
+        
+        Raises DuplicateKeyError when the update collides with a unique index
+        (e.g. a username that is already taken).
+        """
         collection = User.get_collection()
         update_data['updated_at'] = datetime.utcnow()
         
         try:
             result = collection.find_one_and_update(
-                {'_id': ObjectId(user_id)},
+                {'_id': to_object_id(user_id)},
                 {'$set': update_data},
                 return_document=True
             )
             return result
+        except DuplicateKeyError:
+            raise
         except Exception as e:
             print(f"Error updating user: {e}")
             return None
@@ -97,10 +119,7 @@ class User:
     @staticmethod
     def update_password(user_id, new_password):
         """Update user password"""
-        hashed_password = bcrypt.hashpw(
-            new_password.encode('utf-8'),
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        hashed_password = PasswordHasher.hash(new_password)
         
         return User.update(user_id, {'password': hashed_password})
     
@@ -109,47 +128,218 @@ class User:
         """Delete user"""
         collection = User.get_collection()
         try:
-            result = collection.delete_one({'_id': ObjectId(user_id)})
+            result = collection.delete_one({'_id': to_object_id(user_id)})
             return result.deleted_count > 0
-        except:
+        except (InvalidId, TypeError):
             return False
     
+    @staticmethod
+    def history_key(user_id):
+        return f"v1:user:history:{user_id}"
+    
+    @staticmethod
+    def _history_update(entries, now):
+        """Pipeline update that prepends `entries` (newest first) to the history
+        
+        Older entries for the same notes are dropped and the list is capped at
+        HISTORY_LIMIT. Client-supplied values are wrapped in $literal so they
+        are never evaluated as field paths or operators.
+        """
+        note_ids = [entry['note_id'] for entry in entries]
+        return [
+            {
+                '$set': {
+                    'history': {
+                        '$slice': [
+                            {
+                                '$concatArrays': [
+                                    {'$literal': entries},
+                                    {
+                                        '$filter': {
+                                            'input': {'$ifNull': ['$history', []]},
+                                            'as': 'h',
+                                            'cond': {'$not': {'$in': ['$$h.note_id', {'$literal': note_ids}]}}
+                                        }
+                                    }
+                                ]
+                            },
+                            User.HISTORY_LIMIT
+                        ]
+                    },
+                    'updated_at': now
+                }
+            }
+        ]
+    
     @staticmethod
     def add_to_history(user_id, note_id):
-        """Add note to user's history"""
+        """Add note to user's history
+        
+        With Redis buffering enabled the entry is buffered in a bounded sorted
+        set and written to MongoDB later by `flush_history`.
+        """
+        r = get_buffer_redis()
+        if r is not None and isinstance(note_id, str):
+            key = User.history_key(user_id)
+            try:
+                pipe = r.pipeline(transaction=False)
+                pipe.zadd(key, {note_id: time.time()})
+                pipe.zremrangebyrank(key, 0, -(User.HISTORY_LIMIT + 1))
+                pipe.sadd(User.HISTORY_DIRTY_KEY, str(user_id))
+                pipe.execute()
+                return
+            except RedisError:
+                pass
+        
         collection = User.get_collection()
+        now = datetime.utcnow()
         history_entry = {
             'note_id': note_id,
-            'accessed_at': datetime.utcnow()
+            'accessed_at': now
         }
-        
-        # Remove if already exists, then add to front
-        collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {
-                '$pull': {'history': {'note_id': note_id}},
-            }
-        )
         collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {
-                '$push': {
-                    'history': {
-                        '$each': [history_entry],
-                        '$position': 0,
-                        '$slice': 100  # Keep only last 100 entries
-                    }
-                },
-                '$set': {'updated_at': datetime.utcnow()}
-            }
+            {'_id': to_object_id(user_id)},
+            User._history_update([history_entry], now)
         )
     
+    @staticmethod
+    def _history_entries(members):
+        """Turn (note_id, timestamp) pairs from Redis into history entries"""
+        return [
+            {'note_id': note_id.decode('utf-8'), 'accessed_at': datetime.utcfromtimestamp(score)}
+            for note_id, score in members
+        ]
+    
+    @staticmethod
+    def get_history(user):
+        """Return the user's history, newest first, including buffered entries"""
+        history = user.get('history', [])
+        r = get_buffer_redis()
+        if r is None:
+            return history
+        
+        try:
+            members = r.zrevrange(User.history_key(user['_id']), 0, -1, withscores=True)
+        except RedisError:
+            return history
+        
+        if not members:
+            return history
+        
+        pending = User._history_entries(members)
+        pending_ids = {entry['note_id'] for entry in pending}
+        merged = pending + [entry for entry in history if entry.get('note_id') not in pending_ids]
+        return merged[:User.HISTORY_LIMIT]
+    
+    @staticmethod
+    def flush_history():
+        """Write buffered history entries to MongoDB with one unordered bulk write
+        
+        The dirty set and each user's sorted set are renamed away first, so
+        concurrent flushers never apply the same entries twice. The claimed
+        keys are only deleted once MongoDB has the entries; on any failure
+        they are merged back into the live buffer for the next flush.
+        """
+        r = get_redis()
+        if r is None:
+            return 0
+        
+        suffix = f"flush:{uuid.uuid4().hex}"
+        dirty_key = f"{User.HISTORY_DIRTY_KEY}:{suffix}"
+        try:
+            r.rename(User.HISTORY_DIRTY_KEY, dirty_key)
+        except ResponseError:
+            # Nothing buffered since the last flush
+            return 0
+        except RedisError as e:
+            print(f"Error flushing history: {e}")
+            return 0
+        
+        user_ids = []
+        try:
+            user_ids = [user_id.decode('utf-8') for user_id in r.smembers(dirty_key)]
+            
+            # Claim every user's buffer, then read them all, in two round trips
+            pipe = r.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.rename(User.history_key(user_id), f"{User.history_key(user_id)}:{suffix}")
+            renamed = pipe.execute(raise_on_error=False)
+            claimed = [
+                user_id for user_id, result in zip(user_ids, renamed)
+                if not isinstance(result, Exception)
+            ]
+            
+            pipe = r.pipeline(transaction=False)
+            for user_id in claimed:
+                pipe.zrevrange(f"{User.history_key(user_id)}:{suffix}", 0, -1, withscores=True)
+            buffered = dict(zip(claimed, pipe.execute()))
+        except RedisError as e:
+            print(f"Error flushing history: {e}")
+            User._requeue_history(user_ids, suffix)
+            return 0
+        
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne(
+                {'_id': ObjectId(user_id)},
+                User._history_update(User._history_entries(members), now)
+            )
+            for user_id, members in buffered.items() if members and ObjectId.is_valid(user_id)
+        ]
+        
+        try:
+            if ops:
+                User.get_collection().bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            print(f"Error flushing history: {e}")
+            # Re-applying entries is idempotent, so retry every user next time
+            User._requeue_history(claimed, suffix)
+            return 0
+        
+        try:
+            r.delete(dirty_key, *[f"{User.history_key(user_id)}:{suffix}" for user_id in claimed])
+        except RedisError as e:
+            print(f"Error flushing history: {e}")
+        
+        return len(ops)
+    
+    @staticmethod
+    def _requeue_history(user_ids, suffix):
+        """Merge claimed history buffers back into the live ones after a failed flush
+        
+        Keeps the newest access per note, re-marks the users dirty and drops
+        the claimed keys.
+        """
+        r = get_redis()
+        
+        dirty_key = f"{User.HISTORY_DIRTY_KEY}:{suffix}"
+        try:
+            pipe = r.pipeline(transaction=False)
+            for user_id in user_ids:
+                key = User.history_key(user_id)
+                claimed_key = f"{key}:{suffix}"
+                pipe.zunionstore(key, [key, claimed_key], aggregate='MAX')
+                pipe.zremrangebyrank(key, 0, -(User.HISTORY_LIMIT + 1))
+                pipe.delete(claimed_key)
+            pipe.sunionstore(User.HISTORY_DIRTY_KEY, [User.HISTORY_DIRTY_KEY, dirty_key])
+            pipe.delete(dirty_key)
+            pipe.execute()
+        except RedisError as e:
+            print(f"Error requeueing history: {e}")
+    
     @staticmethod
     def remove_from_history(user_id, note_id):
         """Remove note from user's history"""
+        r = get_buffer_redis()
+        if r is not None:
+            try:
+                r.zrem(User.history_key(user_id), note_id)
+            except RedisError:
+                pass
+        
         collection = User.get_collection()
         collection.update_one(
-            {'_id': ObjectId(user_id)},
+            {'_id': to_object_id(user_id)},
             {
                 '$pull': {'history': {'note_id': note_id}},
                 '$set': {'updated_at': datetime.utcnow()}
@@ -167,5 +357,5 @@ class User:
             'username': user.get('username'),
             'display_name': user.get('display_name'),
             'avatar_url': user.get('avatar_url'),
-            'created_at': user.get('created_at').isoformat() if user.get('created_at') else None
+            'created_at': user.get('created_at')
         }
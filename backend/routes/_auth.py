@@ -0,0 +1,47 @@
+"""
+Authentication helpers shared by the route modules
+"""
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+def _has_token_candidate():
+    """Check whether the request could carry an access token where JWTs are read from"""
+    config = current_app.config
+    locations = config.get('JWT_TOKEN_LOCATION', ('headers',))
+    if isinstance(locations, str):
+        locations = (locations,)
+    
+    # Only headers and cookies can be sniffed cheaply; otherwise always verify
+    if not set(locations) <= {'headers', 'cookies'}:
+        return True
+    if 'headers' in locations and config.get('JWT_HEADER_NAME', 'Authorization') in request.headers:
+        return True
+    if 'cookies' in locations and config.get('JWT_ACCESS_COOKIE_NAME', 'access_token_cookie') in request.cookies:
+        return True
+    return False
+
+def get_optional_user_id():
+    """Get user ID if authenticated, None otherwise
+    
+    The result is kept on `g`, so the token is verified at most once per
+    request however many times this is called.
+    """
+    if '_optional_user_id' in g:
+        return g._optional_user_id
+    
+    # Anonymous requests carry no token at all; skip the JWT machinery for them
+    if not _has_token_candidate():
+        g._optional_user_id = None
+        return None
+    
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except (JWTExtendedException, PyJWTError):
+        user_id = None
+    
+    g._optional_user_id = user_id
+    return user_id
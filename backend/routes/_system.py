@@ -0,0 +1,30 @@
+"""
+System routes: API root, health check and app-wide error handlers
+"""
+
+from flask import Blueprint, jsonify
+
+system_bp = Blueprint('system', __name__)
+
+# Root route
+@system_bp.route('/')
+def index():
+    return jsonify({
+        'name': 'Mowndark API',
+        'version': '1.0.0',
+        'description': 'Markdown Editor Backend'
+    })
+
+# Health check
+@system_bp.route('/health')
+def health():
+    return jsonify({'status': 'healthy'})
+
+# Error handlers
+@system_bp.app_errorhandler(404)
+def not_found(e):
+    return jsonify({'error': 'Not found'}), 404
+
+@system_bp.app_errorhandler(500)
+def server_error(e):
+    return jsonify({'error': 'Internal server error'}), 500
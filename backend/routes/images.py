@@ -1,63 +1,72 @@
 """
-Image routes for uploading and serving images stored in MongoDB
+Image routes for uploading and serving images stored in GridFS or S3
 """
 
-import base64
-from io import BytesIO
-from flask import Blueprint, request, jsonify, send_file, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from urllib.parse import quote
+from flask import Blueprint, Response, request, jsonify, redirect, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from pymongo.errors import PyMongoError
+from werkzeug.exceptions import RequestEntityTooLarge
 from models.image import Image
+from routes._auth import get_optional_user_id
 from bson import ObjectId
 
 images_bp = Blueprint('images', __name__)
 
-def get_optional_user_id():
-    """Get user ID if authenticated, None otherwise"""
-    try:
-        verify_jwt_in_request(optional=True)
-        return get_jwt_identity()
-    except:
-        return None
+# Image types accepted for upload
+ALLOWED_MIME_TYPES = frozenset({'image/png', 'image/jpeg', 'image/gif', 'image/webp'})
 
 @images_bp.route('/upload', methods=['POST'])
 def upload_image():
-    """Upload an image and store it in MongoDB"""
+    """Upload an image and store it in GridFS or S3"""
     user_id = get_optional_user_id()
     
-    if 'image' not in request.files:
+    # Reject by the declared body size before any of it is read
+    max_body = (current_app.config.get('UPLOAD_MAX_FILE_SIZE', 5 * 1024 * 1024)
+                + current_app.config.get('UPLOAD_FORM_OVERHEAD', 64 * 1024))
+    if request.content_length and request.content_length > max_body:
+        return jsonify({'error': 'Image too large. Maximum size is 5MB'}), 413
+    
+    # File parts stream into size-capped spool files while the body is parsed
+    # (see uploads.UploadRequest), so oversized images abort here early
+    try:
+        files = request.files
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Image too large. Maximum size is 5MB'}), 413
+    
+    if 'image' not in files:
         return jsonify({'error': 'No image file provided'}), 400
     
-    file = request.files['image']
+    file = files['image']
     note_id = request.form.get('note_id')
     
     if file.filename == '':
         return jsonify({'error': 'No image selected'}), 400
     
     # Check file type
-    allowed_types = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
-    if file.content_type not in allowed_types:
+    if file.content_type not in ALLOWED_MIME_TYPES:
         return jsonify({'error': 'Invalid image type. Allowed: PNG, JPEG, GIF, WebP'}), 400
     
-    # Check file size (max 5MB)
-    file.seek(0, 2)  # Seek to end
-    size = file.tell()
-    file.seek(0)  # Seek back to start
+    # Size and content hash are known from the spooled upload without reading it back
+    size = file.stream.bytes_written
+    sha256 = file.stream.sha256.hexdigest()
     
-    if size > 5 * 1024 * 1024:  # 5MB
-        return jsonify({'error': 'Image too large. Maximum size is 5MB'}), 400
+    # Re-uploading the same image to the same note reuses the stored copy
+    image = Image.find_duplicate(sha256, note_id=note_id, uploaded_by=user_id)
+    status = 200
     
-    # Read file data
-    image_data = file.read()
-    
-    # Create image record
-    image = Image.create(
-        filename=file.filename,
-        content_type=file.content_type,
-        data=image_data,
-        size=size,
-        note_id=note_id,
-        uploaded_by=user_id
-    )
+    if not image:
+        # Stream file data into storage
+        image = Image.create(
+            filename=file.filename,
+            content_type=file.content_type,
+            data=file.stream,
+            size=size,
+            note_id=note_id,
+            uploaded_by=user_id,
+            sha256=sha256
+        )
+        status = 201
     
     if not image:
         return jsonify({'error': 'Failed to save image'}), 500
@@ -71,24 +80,125 @@ def upload_image():
         'url': image_url,
         'filename': file.filename,
         'size': size
-    }), 201
+    }), status
+
+# GridFS read size when streaming image bodies
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _stream_gridfs(grid_out, start=0, stop=None):
+    """Yield a GridOut's bytes (or just bytes [start, stop)) in fixed-size chunks"""
+    if start:
+        grid_out.seek(start)
+    remaining = (grid_out.length if stop is None else stop) - start
+    while remaining > 0 and (chunk := grid_out.read(min(STREAM_CHUNK_SIZE, remaining))):
+        remaining -= len(chunk)
+        yield chunk
+
+class RangeNotSatisfiable(Exception):
+    """The client asked for a byte range outside the image"""
+    
+    def __init__(self, length):
+        super().__init__(length)
+        self.length = length
+
+def _requested_range(image_id, length):
+    """Return the single (start, stop) byte range requested, or None for the whole image
+    
+    Multi-range requests and stale If-Range validators get the full body;
+    a range past the end raises RangeNotSatisfiable.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != 'bytes' or len(byte_range.ranges) != 1:
+        return None
+    
+    # If-Range: only send a part when the client's copy is this image
+    if_range = request.if_range
+    if if_range.date is not None or (if_range.etag is not None and if_range.etag != image_id):
+        return None
+    
+    span = byte_range.range_for_length(length)
+    if span is None:
+        raise RangeNotSatisfiable(length)
+    return span
+
+def _set_immutable_cache_headers(response, image_id):
+    """Mark an image response as cacheable forever, keyed by its ID"""
+    response.set_etag(image_id)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+def _image_response(image_id, body, content_type, filename, length, span=None):
+    """Build an inline image response; images are immutable once uploaded
+    
+    With a `span` the body holds just bytes [start, stop) of the image and
+    the response is a 206 partial content reply.
+    """
+    response = Response(body, mimetype=content_type)
+    response.headers['Accept-Ranges'] = 'bytes'
+    
+    if span is None:
+        response.headers['Content-Length'] = str(length)
+    else:
+        start, stop = span
+        response.status_code = 206
+        response.headers['Content-Length'] = str(stop - start)
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{length}"
+    
+    try:
+        filename.encode('ascii')
+        response.headers.set('Content-Disposition', 'inline', filename=filename)
+    except UnicodeEncodeError:
+        response.headers.set('Content-Disposition', 'inline', **{'filename*': f"UTF-8''{quote(filename, safe='')}"})
+    
+    return _set_immutable_cache_headers(response, image_id)
 
 @images_bp.route('/<image_id>', methods=['GET'])
 def get_image(image_id):
     """Get an image by ID"""
+    # The ID identifies the bytes, so a matching ETag needs no lookup at all;
+    # "*" only means "any current representation" and says nothing about this ID
+    etags = request.if_none_match
+    if not etags.star_tag and image_id in etags:
+        return _set_immutable_cache_headers(Response(status=304), image_id)
+    
     try:
+        # Cache-aside: images never change after upload
+        cached = Image.get_cached(image_id)
+        if cached:
+            content_type, filename, data = cached
+            span = _requested_range(image_id, len(data))
+            body = data if span is None else data[span[0]:span[1]]
+            return _image_response(image_id, body, content_type, filename, len(data), span)
+        
         image = Image.find_by_id(image_id)
         
         if not image:
             return jsonify({'error': 'Image not found'}), 404
         
-        # Return the image data
-        return send_file(
-            BytesIO(image['data']),
-            mimetype=image['content_type'],
-            as_attachment=False,
-            download_name=image.get('filename', 'image')
-        )
+        # Object-store images are served by the store itself
+        if image.metadata.get('s3_key'):
+            return redirect(Image.presigned_url(image))
+        
+        content_type = image.metadata.get('content_type')
+        filename = image.filename or 'image'
+        span = _requested_range(image_id, image.length)
+        
+        # Small images are read once and cached; larger ones stream from GridFS,
+        # seeking straight to the requested range
+        if image.length <= current_app.config.get('IMAGE_CACHE_MAX_SIZE', 1024 * 1024):
+            data = image.read()
+            Image.set_cached(image_id, content_type, filename, data)
+            body = data if span is None else data[span[0]:span[1]]
+            return _image_response(image_id, body, content_type, filename, len(data), span)
+        
+        body = _stream_gridfs(image) if span is None else _stream_gridfs(image, *span)
+        return _image_response(image_id, body, content_type, filename, image.length, span)
+    except RangeNotSatisfiable as e:
+        response = jsonify({'error': 'Requested range not satisfiable'})
+        response.headers['Content-Range'] = f"bytes */{e.length}"
+        return response, 416
     except Exception as e:
         print(f"Error retrieving image: {e}")
         return jsonify({'error': 'Failed to retrieve image'}), 500
@@ -99,20 +209,18 @@ def delete_image(image_id):
     """Delete an image"""
     user_id = get_jwt_identity()
     
-    image = Image.find_by_id(image_id)
-    
-    if not image:
-        return jsonify({'error': 'Image not found'}), 404
+    # Only the uploader can delete; the check and the delete are one operation
+    try:
+        image = Image.delete_if_owner(image_id, user_id)
+    except PyMongoError as e:
+        print(f"Error deleting image: {e}")
+        return jsonify({'error': 'Failed to delete image'}), 500
     
-    # Only the uploader can delete
-    if image.get('uploaded_by') != user_id:
+    if image is None:
+        if not Image.exists(image_id):
+            return jsonify({'error': 'Image not found'}), 404
         return jsonify({'error': 'You do not have permission to delete this image'}), 403
     
-    success = Image.delete(image_id)
-    
-    if not success:
-        return jsonify({'error': 'Failed to delete image'}), 500
-    
     return jsonify({'message': 'Image deleted successfully'})
 
 @images_bp.route('/note/<note_id>', methods=['GET'])
@@ -3,20 +3,14 @@ Note routes for CRUD operations on markdown notes
 """
 
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from pymongo.errors import PyMongoError
 from models.note import Note
 from models.user import User
+from routes._auth import get_optional_user_id
 
 notes_bp = Blueprint('notes', __name__)
 
-def get_optional_user_id():
-    """Get user ID if authenticated, None otherwise"""
-    try:
-        verify_jwt_in_request(optional=True)
-        return get_jwt_identity()
-    except:
-        return None
-
 @notes_bp.route('', methods=['GET'])
 @jwt_required()
 def get_my_notes():
@@ -25,7 +19,7 @@ def get_my_notes():
     notes = Note.find_by_owner(user_id)
     
     return jsonify({
-        'notes': [Note.to_json(note) for note in notes]
+        'notes': [Note.to_json(note, include_content=False) for note in notes]
     })
 
 @notes_bp.route('', methods=['POST'])
@@ -73,8 +67,8 @@ def get_note(note_id):
     if not Note.can_view(note, user_id):
         return jsonify({'error': 'You do not have permission to view this note'}), 403
     
-    # Increment view count
-    Note.increment_view_count(note['_id'])
+    # Increment view count (Redis may still hold earlier views)
+    note['view_count'] = note.get('view_count', 0) + Note.increment_view_count(note['_id'])
     
     return jsonify({
         'note': Note.to_json(note)
@@ -121,20 +115,20 @@ def update_note(note_id):
 def delete_note(note_id):
     """Delete a note"""
     user_id = get_jwt_identity()
-    note = Note.find_by_id_or_shortid(note_id)
     
-    if not note:
-        return jsonify({'error': 'Note not found'}), 404
+    # Ownership check and delete happen in one server-side operation
+    try:
+        note = Note.delete_if_owner(note_id, user_id)
+    except PyMongoError as e:
+        print(f"Error deleting note: {e}")
+        return jsonify({'error': 'Failed to delete note'}), 500
     
-    # Only owner can delete
-    if not Note.is_owner(note, user_id):
+    if note is None:
+        if not Note.exists(note_id):
+            return jsonify({'error': 'Note not found'}), 404
+        # Only owner can delete
         return jsonify({'error': 'Only the owner can delete this note'}), 403
     
-    success = Note.delete(note['_id'])
-    
-    if not success:
-        return jsonify({'error': 'Failed to delete note'}), 500
-    
     return jsonify({
         'message': 'Note deleted successfully'
     })
@@ -145,11 +139,7 @@ def delete_note(note_id):
 def get_published_note(shortid):
     """Get a published/public view of a note"""
     user_id = get_optional_user_id()
-    note = Note.find_by_shortid(shortid)
-    
-    if not note:
-        # Try alias
-        note = Note.find_by_alias(shortid)
+    note = Note.find_by_shortid_or_alias(shortid)
     
     if not note:
         return jsonify({'error': 'Note not found'}), 404
@@ -157,7 +147,7 @@ def get_published_note(shortid):
     if not Note.can_view(note, user_id):
         return jsonify({'error': 'You do not have permission to view this note'}), 403
     
-    Note.increment_view_count(note['_id'])
+    note['view_count'] = note.get('view_count', 0) + Note.increment_view_count(note['_id'])
     
     return jsonify({
         'note': Note.to_json(note, include_content=True)
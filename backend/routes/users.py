@@ -4,11 +4,16 @@ User routes for user management
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from pymongo.errors import DuplicateKeyError
 from models.user import User
 from models.note import Note
+from models.image import Image
 
 users_bp = Blueprint('users', __name__)
 
+# Profile fields a user may change through PUT /me
+ALLOWED_PROFILE_FIELDS = frozenset({'username', 'display_name', 'avatar_url'})
+
 @users_bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_profile():
@@ -31,16 +36,13 @@ def update_profile():
     data = request.get_json() or {}
     
     # Fields that can be updated
-    allowed_fields = ['username', 'display_name', 'avatar_url']
-    update_data = {k: v for k, v in data.items() if k in allowed_fields}
-    
-    if 'username' in update_data:
-        # Check if username is already taken
-        existing_user = User.find_by_username(update_data['username'])
-        if existing_user and str(existing_user['_id']) != user_id:
-            return jsonify({'error': 'Username already taken'}), 409
+    update_data = {k: data[k] for k in data.keys() & ALLOWED_PROFILE_FIELDS}
     
-    updated_user = User.update(user_id, update_data)
+    # The unique username index rejects a taken name in the same write
+    try:
+        updated_user = User.update(user_id, update_data)
+    except DuplicateKeyError:
+        return jsonify({'error': 'Username already taken'}), 409
     
     if not updated_user:
         return jsonify({'error': 'Failed to update profile'}), 500
@@ -71,7 +73,7 @@ def change_password():
     if not user or not User.verify_password(user, current_password):
         return jsonify({'error': 'Current password is incorrect'}), 401
     
-    success = User.update_password(user_id, new_password)
+    success = User.update_password(user['_id'], new_password)
     
     if not success:
         return jsonify({'error': 'Failed to update password'}), 500
@@ -86,8 +88,9 @@ def delete_account():
     """Delete current user account"""
     user_id = get_jwt_identity()
     
-    # Delete all user's notes first
+    # Delete all user's notes and uploads first, one bulk delete each
     Note.delete_by_owner(user_id)
+    Image.delete_by_user(user_id)
     
     # Delete user
     success = User.delete(user_id)
@@ -108,11 +111,7 @@ def get_user_profile(username):
         return jsonify({'error': 'User not found'}), 404
     
     # Get user's public notes (protected, editable, freely)
-    collection = Note.get_collection()
-    public_notes = list(collection.find({
-        'owner_id': str(user['_id']),
-        'permission': {'$in': ['protected', 'editable', 'freely']}
-    }).sort('updated_at', -1).limit(50))
+    public_notes = Note.find_public_by_owner(str(user['_id']))
     
     return jsonify({
         'user': User.to_json(user),
@@ -127,7 +126,7 @@ def get_my_notes():
     notes = Note.find_by_owner(user_id)
     
     return jsonify({
-        'notes': [Note.to_json(note) for note in notes]
+        'notes': [Note.to_json(note, include_content=False) for note in notes]
     })
 
 @users_bp.route('/me/history', methods=['GET'])
@@ -140,7 +139,7 @@ def get_history():
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    history = user.get('history', [])
+    history = User.get_history(user)
     
     return jsonify({
         'history': history
@@ -0,0 +1,41 @@
+"""
+One-shot backfill of the stored `description` field for existing notes
+
+Usage (from the backend directory):
+    python scripts/backfill_descriptions.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import UpdateOne
+from app import app
+from models.note import Note
+
+BATCH_SIZE = 500
+
+def backfill():
+    """Set `description` on every note that does not have one yet"""
+    collection = Note.get_collection()
+    cursor = collection.find({'description': {'$exists': False}}, {'content': 1})
+    
+    updated = 0
+    batch = []
+    for note in cursor:
+        description = Note.generate_description(note.get('content') or '')
+        batch.append(UpdateOne({'_id': note['_id']}, {'$set': {'description': description}}))
+        if len(batch) >= BATCH_SIZE:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    
+    return updated
+
+if __name__ == '__main__':
+    with app.app_context():
+        count = backfill()
+    print(f"Backfilled descriptions for {count} notes")
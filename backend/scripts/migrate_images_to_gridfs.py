@@ -0,0 +1,65 @@
+"""
+One-shot migration of images from the legacy `images` collection into GridFS
+
+Images uploaded before the switch to GridFS were stored as a single document
+with the bytes in a `data` field. Each one is copied into the `images` bucket
+under the same `_id`, so `/api/images/<id>` links embedded in notes keep
+working, and the legacy document is removed once its copy is complete.
+Re-running the script resumes where it stopped.
+
+Usage (from the backend directory):
+    python scripts/migrate_images_to_gridfs.py
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from database import get_bucket, get_collection
+from models.image import Image
+
+LEGACY_COLLECTION = 'images'
+
+def migrate():
+    """Copy every legacy image document into GridFS, keeping its ID"""
+    legacy = get_collection(LEGACY_COLLECTION)
+    files = Image.get_collection()
+    chunks = Image.get_chunks_collection()
+    bucket = get_bucket()
+    
+    migrated = 0
+    for image in legacy.find({'data': {'$exists': True}}):
+        image_id = image['_id']
+        data = bytes(image['data'])
+        
+        # A files document is written last, so its presence means the copy is whole
+        if files.count_documents({'_id': image_id}, limit=1) == 0:
+            # Drop chunks left behind by an interrupted earlier run
+            chunks.delete_many({'files_id': image_id})
+            bucket.upload_from_stream_with_id(
+                image_id,
+                image.get('filename') or 'image',
+                data,
+                metadata={
+                    'content_type': image.get('content_type'),
+                    'note_id': image.get('note_id'),
+                    'uploaded_by': image.get('uploaded_by'),
+                    'sha256': hashlib.sha256(data).hexdigest()
+                }
+            )
+            # Keep the original upload time for listings
+            if image.get('created_at'):
+                files.update_one({'_id': image_id}, {'$set': {'uploadDate': image['created_at']}})
+        
+        legacy.delete_one({'_id': image_id})
+        migrated += 1
+    
+    return migrated
+
+if __name__ == '__main__':
+    with app.app_context():
+        count = migrate()
+    print(f"Migrated {count} images into GridFS")
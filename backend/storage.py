@@ -0,0 +1,41 @@
+"""
+Optional S3-compatible object storage for image binaries
+"""
+
+s3_client = None
+s3_bucket = None
+
+def init_storage(app):
+    """Initialize the S3 client when an object store is configured
+
+    Without S3_BUCKET images stay in GridFS and this is a no-op.
+    """
+    global s3_client, s3_bucket
+    
+    s3_bucket = app.config.get('S3_BUCKET')
+    if not s3_bucket:
+        return None
+    
+    import boto3
+    
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=app.config.get('S3_ENDPOINT'),
+        region_name=app.config.get('S3_REGION'),
+        aws_access_key_id=app.config.get('S3_ACCESS_KEY'),
+        aws_secret_access_key=app.config.get('S3_SECRET_KEY')
+    )
+    
+    app.extensions['s3'] = s3_client
+    
+    return s3_client
+
+def get_s3():
+    """Get the S3 client, or None if images are kept in GridFS"""
+    global s3_client
+    return s3_client
+
+def get_s3_bucket():
+    """Get the configured S3 bucket name"""
+    global s3_bucket
+    return s3_bucket
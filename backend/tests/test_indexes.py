@@ -0,0 +1,65 @@
+"""
+Index tests - run against the MongoDB at MONGODB_URI, skipped when none is reachable
+"""
+
+import os
+import sys
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+import database
+from models.note import Note
+from models.user import User
+
+class OptionalUniqueFieldTest(unittest.TestCase):
+    """Unset aliases and usernames are stored as null and must not collide"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(
+            os.environ.get('MONGODB_URI', 'mongodb://localhost:27017'),
+            serverSelectionTimeoutMS=1000
+        )
+        try:
+            cls.client.admin.command('ping')
+        except PyMongoError as e:
+            raise unittest.SkipTest(f"MongoDB not reachable: {e}")
+        
+        cls.db_name = f"mowndark_test_{uuid.uuid4().hex}"
+        database.db = cls.client[cls.db_name]
+        database._create_indexes()
+        
+        # The password hasher is configured from the current app
+        cls.app_context = Flask(__name__).app_context()
+        cls.app_context.push()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+        cls.client.drop_database(cls.db_name)
+        database.db = None
+        cls.client.close()
+    
+    def test_notes_without_alias(self):
+        self.assertIsNotNone(Note.create(title='First'))
+        self.assertIsNotNone(Note.create(title='Second'))
+    
+    def test_alias_stays_unique(self):
+        self.assertIsNotNone(Note.create(title='First', alias='taken'))
+        self.assertIsNone(Note.create(title='Second', alias='taken'))
+    
+    def test_users_without_username(self):
+        self.assertIsNotNone(User.create('first@example.com', 'password'))
+        self.assertIsNotNone(User.create('second@example.com', 'password'))
+    
+    def test_username_stays_unique(self):
+        self.assertIsNotNone(User.create('third@example.com', 'password', username='taken'))
+        self.assertIsNone(User.create('fourth@example.com', 'password', username='taken'))
+
+if __name__ == '__main__':
+    unittest.main()
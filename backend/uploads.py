@@ -0,0 +1,40 @@
+"""
+Streaming, size-capped handling of multipart file uploads
+"""
+
+import hashlib
+from tempfile import SpooledTemporaryFile
+from flask import current_app
+from flask.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+class LimitedSpooledFile(SpooledTemporaryFile):
+    """Spooled temp file that refuses to grow past a byte limit
+    
+    werkzeug writes each multipart file part into this as it parses the body,
+    so an oversized upload is rejected as soon as the limit is crossed instead
+    of after the whole part has been buffered. The SHA-256 of the content is
+    computed on the way in, so it never has to be read back for hashing.
+    """
+    
+    def __init__(self, limit, max_size):
+        super().__init__(max_size=max_size, mode='rb+')
+        self.limit = limit
+        self.bytes_written = 0
+        self.sha256 = hashlib.sha256()
+    
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.bytes_written > self.limit:
+            raise RequestEntityTooLarge()
+        self.sha256.update(data)
+        return super().write(data)
+
+class UploadRequest(Request):
+    """Request class whose file parts stream into LimitedSpooledFile"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return LimitedSpooledFile(
+            limit=current_app.config.get('UPLOAD_MAX_FILE_SIZE', 5 * 1024 * 1024),
+            max_size=current_app.config.get('UPLOAD_SPOOL_SIZE', 1024 * 1024)
+        )
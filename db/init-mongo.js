@@ -8,11 +8,14 @@ db.createCollection('notes');
 
 // Create indexes for better query performance
 db.users.createIndex({ "email": 1 }, { unique: true });
-db.users.createIndex({ "username": 1 }, { unique: true });
+db.users.createIndex({ "username": 1 }, { unique: true, partialFilterExpression: { username: { $type: "string" } } });
 db.notes.createIndex({ "owner_id": 1 });
-db.notes.createIndex({ "shortid": 1 }, { unique: true });
-db.notes.createIndex({ "alias": 1 }, { sparse: true });
+db.notes.createIndex({ "shortid": 1 }, { unique: true, sparse: true });
+db.notes.createIndex({ "alias": 1 }, { unique: true, partialFilterExpression: { alias: { $type: "string" } } });
 db.notes.createIndex({ "created_at": -1 });
 db.notes.createIndex({ "updated_at": -1 });
 
+// Options must match backend/database.py INDEXES; the backend creates the
+// remaining compound and GridFS indexes on startup
+
 print('MongoDB initialized successfully for Mowndark!');